@@ -1,10 +1,9 @@
-import time
 from datetime import datetime
 
-import pandas as pd
-import pydeck as pdk
-import requests
 import streamlit as st
+from streamlit.components.v1 import html as _html
+
+from taxifare.ui import MAP_HEIGHT, make_map_with_route, predict_fare, route_key
 
 # -----------------------------
 # Page config
@@ -13,113 +12,6 @@ st.set_page_config(page_title="Taxi Fare Predictor", page_icon="🚕", layout="c
 st.title("🚕 taxi fare predictor")
 st.caption("mets un trajet ➜ la carte se met à jour en live. clique sur **save & predict** pour estimer le prix 💸")
 
-API_URL = "https://wagon-data-tpl-image-129712465951.europe-west1.run.app/predict"
-BASEMAP_STYLE = "https://basemaps.cartocdn.com/gl/positron-gl-style/style.json"
-OSRM_URL = "https://router.project-osrm.org/route/v1/driving"
-
-
-# -----------------------------
-# Helpers
-# -----------------------------
-def build_params(
-    pickup_datetime: datetime,
-    pickup_longitude: float,
-    pickup_latitude: float,
-    dropoff_longitude: float,
-    dropoff_latitude: float,
-    passenger_count: int,
-) -> dict:
-    return {
-        "pickup_datetime": pickup_datetime.strftime("%Y-%m-%d %H:%M:%S"),
-        "pickup_longitude": pickup_longitude,
-        "pickup_latitude": pickup_latitude,
-        "dropoff_longitude": dropoff_longitude,
-        "dropoff_latitude": dropoff_latitude,
-        "passenger_count": passenger_count,
-    }
-
-
-def call_fare_api(url: str, params: dict) -> float:
-    resp = requests.get(url, params=params, timeout=10)
-    resp.raise_for_status()
-    return float(resp.json()["fare"])
-
-
-@st.cache_data(ttl=60, show_spinner=False)
-def get_route_osrm_cached(
-    pickup_lon: float,
-    pickup_lat: float,
-    dropoff_lon: float,
-    dropoff_lat: float,
-) -> list[list[float]]:
-    """
-    Route following roads via OSRM.
-    Cached to avoid hammering OSRM on every rerun.
-    """
-    coords = f"{pickup_lon},{pickup_lat};{dropoff_lon},{dropoff_lat}"
-    route_url = f"{OSRM_URL}/{coords}"
-    params = {"overview": "full", "geometries": "geojson"}
-
-    r = requests.get(route_url, params=params, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    return data["routes"][0]["geometry"]["coordinates"]  # [[lon, lat], ...]
-
-
-def make_map_with_route(
-    pickup_lon: float,
-    pickup_lat: float,
-    dropoff_lon: float,
-    dropoff_lat: float,
-) -> pdk.Deck:
-    points_df = pd.DataFrame(
-        [
-            {"type": "pickup 📍", "lat": pickup_lat, "lon": pickup_lon},
-            {"type": "dropoff 🏁", "lat": dropoff_lat, "lon": dropoff_lon},
-        ]
-    )
-
-    # route roads (fallback ligne droite si OSRM tombe)
-    try:
-        route_coords = get_route_osrm_cached(pickup_lon, pickup_lat, dropoff_lon, dropoff_lat)
-    except Exception:
-        route_coords = [[pickup_lon, pickup_lat], [dropoff_lon, dropoff_lat]]
-
-    route_df = pd.DataFrame([{"path": route_coords}])
-
-    center_lat = (pickup_lat + dropoff_lat) / 2
-    center_lon = (pickup_lon + dropoff_lon) / 2
-
-    layers = [
-        pdk.Layer(
-            "ScatterplotLayer",
-            data=points_df,
-            get_position="[lon, lat]",
-            get_radius=90,
-            pickable=True,
-        ),
-        pdk.Layer(
-            "PathLayer",
-            data=route_df,
-            get_path="path",
-            width_scale=20,
-            width_min_pixels=3,
-            pickable=False,
-        ),
-    ]
-
-    return pdk.Deck(
-        map_style=BASEMAP_STYLE,
-        initial_view_state=pdk.ViewState(
-            latitude=center_lat,
-            longitude=center_lon,
-            zoom=12,
-            pitch=0,
-        ),
-        layers=layers,
-        tooltip={"text": "{type}"},
-    )
-
 
 # -----------------------------
 # Init default state (so map always has values)
@@ -158,13 +50,18 @@ st.number_input("👥 passenger count", key="passenger_count", min_value=1, max_
 # -----------------------------
 st.subheader("🗺️ route preview (roads)")
 
-deck = make_map_with_route(
+trip_key = route_key(
     st.session_state["pickup_longitude"],
     st.session_state["pickup_latitude"],
     st.session_state["dropoff_longitude"],
     st.session_state["dropoff_latitude"],
 )
-st.pydeck_chart(deck, use_container_width=True)
+# only rebuild (and hit OSRM) when coords changed since last rerun, or the last map was a fallback
+if st.session_state.get("_last_route_key") != trip_key:
+    st.session_state["_last_map_html"], routed = make_map_with_route(trip_key)
+    # don't pin the straight-line fallback: retry once the 30s negative cache expires
+    st.session_state["_last_route_key"] = trip_key if routed else None
+_html(st.session_state["_last_map_html"], height=MAP_HEIGHT + 20)
 
 # -----------------------------
 # Prediction — ONLY when clicking the button
@@ -172,21 +69,18 @@ st.pydeck_chart(deck, use_container_width=True)
 st.subheader("💸 fare prediction")
 
 if st.button("🚀 save & predict"):
-    params = build_params(
-        st.session_state["pickup_datetime"],
-        st.session_state["pickup_longitude"],
-        st.session_state["pickup_latitude"],
-        st.session_state["dropoff_longitude"],
-        st.session_state["dropoff_latitude"],
-        st.session_state["passenger_count"],
-    )
-
     with st.spinner("🤖 calling the model..."):
-        fare = call_fare_api(API_URL, params)
-        time.sleep(0.3)
+        fare = predict_fare(
+            st.session_state["pickup_datetime"].isoformat(sep=" ", timespec="seconds"),
+            st.session_state["pickup_longitude"],
+            st.session_state["pickup_latitude"],
+            st.session_state["dropoff_longitude"],
+            st.session_state["dropoff_latitude"],
+            st.session_state["passenger_count"],
+        )
 
     st.success("✅ prediction ready")
     st.metric("💸 fare ($)", f"{fare:.2f}")
 
 st.divider()
-st.caption("💡 la carte suit les routes via OSRM. pour éviter de spammer OSRM, le routing est caché 60s (ttl).")
+st.caption("💡 la carte suit les routes via OSRM. pour éviter de spammer OSRM, le routing est caché 1h (ttl).")
@@ -0,0 +1,216 @@
+"""
+Shared helpers for the taxifare streamlit app: HTTP session, fare API, OSRM routing, pydeck map.
+"""
+from __future__ import annotations
+
+import math
+from types import MappingProxyType
+from typing import TYPE_CHECKING
+from urllib.parse import quote
+
+import orjson
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    import pydeck as pdk
+
+API_URL = "https://wagon-data-tpl-image-129712465951.europe-west1.run.app/predict"
+FARE_QUERY = (
+    API_URL
+    + "?pickup_datetime={}&pickup_longitude={}&pickup_latitude={}"
+    + "&dropoff_longitude={}&dropoff_latitude={}&passenger_count={}"
+)
+BASEMAP_STYLE = "https://basemaps.cartocdn.com/gl/positron-gl-style/style.json"
+OSRM_HOST = "https://router.project-osrm.org/"
+OSRM_URL = f"{OSRM_HOST}route/v1/driving"
+OSRM_TIMEOUT = (1.0, 2.0)  # (connect, read): public router can stall, don't block reruns
+MAP_HEIGHT = 600
+FLAT_PATH_MIN_COORDS = 50
+MAX_ZOOM = 16  # zero-length trip / identical fallback points: don't dive to street-furniture zoom
+
+# invariant deck config (read-only, shared by every session)
+TOOLTIP = MappingProxyType({"text": "{type}"})
+SCATTER_LAYER_ARGS = MappingProxyType({"get_position": "position", "get_radius": 90, "pickable": True})
+PATH_LAYER_ARGS = MappingProxyType({"get_path": "path", "width_scale": 20, "width_min_pixels": 3, "pickable": False})
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+@st.cache_resource
+def _http() -> requests.Session:
+    """
+    Shared HTTP session (connection pooling + keep-alive).
+    Cached as a resource so it survives reruns -> no new TLS handshake per call.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+    )
+    session.mount("https://", adapter)
+    # OSRM: tighter retry budget, we'd rather fall back to a straight line fast.
+    # no 429 retry and no Retry-After sleep: urllib3 would sleep uncapped, outside OSRM_TIMEOUT
+    osrm_adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=1,
+            backoff_factor=0.1,
+            status_forcelist=[502, 503, 504],
+            respect_retry_after_header=False,
+        ),
+    )
+    session.mount(OSRM_HOST, osrm_adapter)
+    session.headers.update({"User-Agent": "taxifare-website/1.0"})
+    return session
+
+
+def call_fare_api(url: str) -> float:
+    resp = _http().get(url, timeout=10)
+    resp.raise_for_status()
+    return float(orjson.loads(resp.content)["fare"])
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def predict_fare(
+    pickup_iso: str,
+    p_lon: float,
+    p_lat: float,
+    d_lon: float,
+    d_lat: float,
+    pax: int,
+) -> float:
+    """
+    Fare prediction cached on the ride params.
+    Datetime is passed as a string so the cache key stays cheap to hash.
+    """
+    # floats/ints are url-safe as-is, only the datetime (space, colons) needs quoting
+    return call_fare_api(FARE_QUERY.format(quote(pickup_iso), p_lon, p_lat, d_lon, d_lat, pax))
+
+
+def _q(x: float) -> int:
+    # ~1 m precision -> float wiggle from number_input hits the same cache entry
+    return round(x * 1e5)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _get_route_q(q_lon1: int, q_lat1: int, q_lon2: int, q_lat2: int) -> list[list[float]]:
+    """
+    Route following roads via OSRM, keyed on quantized coords.
+    Cached 1h (roads don't move) to avoid hammering OSRM on every rerun.
+    """
+    coords = f"{q_lon1 / 1e5},{q_lat1 / 1e5};{q_lon2 / 1e5},{q_lat2 / 1e5}"
+    route_url = f"{OSRM_URL}/{coords}"
+    params = {"overview": "simplified", "geometries": "geojson"}
+
+    # simplified overview is plenty at city zoom; gzip explicit in case a proxy strips it
+    r = _http().get(route_url, params=params, headers={"Accept-Encoding": "gzip"}, timeout=OSRM_TIMEOUT)
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    return data["routes"][0]["geometry"]["coordinates"]  # [[lon, lat], ...]
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _route_or_line_q(q_lon1: int, q_lat1: int, q_lon2: int, q_lat2: int) -> tuple[list[list[float]], bool]:
+    """
+    (coords, routed): OSRM route, or the straight line (fallback ligne droite si OSRM tombe).
+    Short ttl doubles as a negative cache: while OSRM is down we don't retry it on every rerun.
+    """
+    try:
+        return _get_route_q(q_lon1, q_lat1, q_lon2, q_lat2), True
+    except Exception:
+        return [[q_lon1 / 1e5, q_lat1 / 1e5], [q_lon2 / 1e5, q_lat2 / 1e5]], False
+
+
+def route_key(
+    pickup_lon: float,
+    pickup_lat: float,
+    dropoff_lon: float,
+    dropoff_lat: float,
+) -> tuple[int, int, int, int]:
+    """
+    Quantized trip key: the single definition of "same route" for the session guard and every cache.
+    """
+    return _q(pickup_lon), _q(pickup_lat), _q(dropoff_lon), _q(dropoff_lat)
+
+
+def _fit_zoom(west: float, south: float, east: float, north: float) -> int:
+    """
+    Largest zoom at which the bbox spans at most 512 px, i.e. fits the MAP_HEIGHT map with padding.
+    """
+    # web mercator stretches latitude by 1/cos(lat): convert the lat span to lon-equivalent degrees
+    lat_span = (north - south) / math.cos(math.radians((north + south) / 2))
+    span = max(east - west, lat_span)
+    if span <= 0:
+        return MAX_ZOOM
+    # deck.gl world is 512 px at zoom 0 -> at floor(log2(360 / span)) the span covers 256-512 px
+    return max(1, min(MAX_ZOOM, math.floor(math.log2(360 / span))))
+
+
+def _build_deck(
+    key: tuple[int, int, int, int],
+    route_coords: tuple[tuple[float, float], ...],
+) -> pdk.Deck:
+    """
+    Deck for a given (quantized) trip + route.
+    Not cached itself: only _deck_html calls it, and that caches the html string.
+    """
+    pickup_lon, pickup_lat, dropoff_lon, dropoff_lat = (q / 1e5 for q in key)
+    import pydeck as pdk  # lazy: only paid when a deck is actually built
+
+    points = [
+        {"type": "pickup 📍", "position": [pickup_lon, pickup_lat]},
+        {"type": "dropoff 🏁", "position": [dropoff_lon, dropoff_lat]},
+    ]
+    if len(route_coords) < FLAT_PATH_MIN_COORDS:
+        route = [{"path": [list(c) for c in route_coords]}]
+        path_format = {}
+    else:
+        # long routes: one flat [lon, lat, lon, lat, ...] array instead of N nested pairs
+        route = [{"path": [x for c in route_coords for x in c]}]
+        path_format = {"position_format": "XY"}
+
+    # fit the camera to the bbox of the route + markers (OSRM snaps endpoints onto roads)
+    lons = [c[0] for c in route_coords] + [pickup_lon, dropoff_lon]
+    lats = [c[1] for c in route_coords] + [pickup_lat, dropoff_lat]
+    west, east, south, north = min(lons), max(lons), min(lats), max(lats)
+
+    layers = [
+        pdk.Layer("ScatterplotLayer", data=points, **SCATTER_LAYER_ARGS),
+        pdk.Layer("PathLayer", data=route, **PATH_LAYER_ARGS, **path_format),
+    ]
+
+    return pdk.Deck(
+        map_style=BASEMAP_STYLE,
+        initial_view_state=pdk.ViewState(
+            latitude=(north + south) / 2,
+            longitude=(west + east) / 2,
+            zoom=_fit_zoom(west, south, east, north),
+            pitch=0,
+        ),
+        layers=layers,
+        tooltip=dict(TOOLTIP),  # pydeck renders it via repr() into the html, needs a real dict
+    )
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _deck_html(key: tuple[int, int, int, int], route_coords: tuple[tuple[float, float], ...]) -> str:
+    # to_html is the expensive step -> cache the html string, never the Deck object
+    deck = _build_deck(key, route_coords)
+    return deck.to_html(as_string=True, iframe_height=MAP_HEIGHT)
+
+
+def make_map_with_route(key: tuple[int, int, int, int]) -> tuple[str, bool]:
+    """
+    Standalone deck.gl html for the trip (key from route_key), rendered via components.html
+    (much smoother pan/zoom than st.pydeck_chart).
+    Also returns whether the route came from OSRM (False = straight-line fallback).
+    """
+    route_coords, routed = _route_or_line_q(*key)
+    return _deck_html(key, tuple(map(tuple, route_coords))), routed
+